@@ -1,11 +1,14 @@
 """Implement 'EC' class, for elliptic curves over Z/mZ."""
 
-from Point import Point, identity
-from helperFuncs import isCurveInd, resCurveInd, modularSlope, modInv
+from Point import Point, JPoint, identity
+from helperFuncs import (modularSlope, modInv, gcd, invert, mpz,
+                         jacobianDouble, jacobianAdd)
 
 class EC:
     """Implements elliptic curves over Z/mZ."""
 
+    __slots__ = ('a', 'b', 'modulus')
+
     def __init__(self, a, b, modulus):
         """Initialize an elliptic curve.
 
@@ -21,9 +24,9 @@ class EC:
         self.modulus : int : The modulus.
         
         """
-        self.a = a % modulus
-        self.b = b % modulus
-        self.modulus = modulus
+        self.a = mpz(a) % modulus
+        self.b = mpz(b) % modulus
+        self.modulus = mpz(modulus)
 
     def tangent(self, P):
         """Return slope of the line tangent to self and a given point.
@@ -36,16 +39,29 @@ class EC:
         -------
         exists : bool : If the slope is well-defined.
         res    : int  : If well-defined the slope else the obstruction.
+
+        Notes
+        -----
+        The inversion is inlined (see 'modInv'), this is on the hot path of
+        the affine group law.
         
         """
-        dx = (3 * (P.x ** 2) + self.a) % self.modulus
+        m, px = self.modulus, P.x
+        dx = (3 * px * px + self.a) % m
         dy = (2 * P.y)
         
-        exists, dyInv = modInv(dy, self.modulus)        
-        if exists:
-            res = (dx * dyInv) % self.modulus
+        if invert is not None:
+            try:
+                exists, res = True, (dx * invert(dy, m)) % m
+            except ZeroDivisionError:
+                exists, res = False, gcd(dy, m)
         else:
-            res = dyInv
+            n, g, prevX, x = dy % m, m, 0, 1
+            while n != 0:
+                (q, n), g = divmod(g, n), n
+                prevX, x = x, prevX - q * x
+            exists = (g == 1)
+            res = (dx * prevX) % m if exists else g
 
         return exists, res
 
@@ -62,11 +78,12 @@ class EC:
         - : Point : The sum of P and Q.
         
         """
-        resX = slope**2 - P.x - Q.x
-        resY = slope*(P.x - resX) - P.y
+        px = P.x
+        resX = slope*slope - px - Q.x
+        resY = slope*(px - resX) - P.y
         
         return Point(resX, resY, self.modulus)
-           
+
     def double(self, P):
         """Attempt to return [2]P.
 
@@ -80,7 +97,7 @@ class EC:
         res    : Point, int : If well-defined [2]P else the obstruction.
         
         """      
-        if P == P.inverse:
+        if P.ID or P.y == 0:
             exists = True
             res = identity
 
@@ -105,12 +122,26 @@ class EC:
         exists : bool       : If P+Q is well-defined.
         res    : Point, int : If well-defined P+Q else the obstruction.
         
+        Notes
+        -----
+        Over a composite modulus P and Q may share an x-coordinate without
+        being equal or inverse (they are mod some prime factors, but not all);
+        the obstruction is then gcd(P.y - Q.y, m).
+        
         """    
-        if P == Q:
-            exists, res = self.double(P)
+        if P.ID:
+            exists, res = True, Q
+
+        elif Q.ID:
+            exists, res = True, P
 
-        elif isCurveInd(P, Q):
-            exists, res = True, resCurveInd(P, Q)
+        elif P.x == Q.x:
+            if P.y == Q.y:
+                exists, res = self.double(P)
+            elif (P.y + Q.y) % self.modulus == 0:
+                exists, res = True, identity
+            else:
+                exists, res = False, gcd(P.y - Q.y, self.modulus)
             
         else:
             exists, slopeAttempt = modularSlope(P, Q)
@@ -121,35 +152,246 @@ class EC:
 
         return exists, res
                     
-    def mult(self, P, k):
+    def __oddMultiples(self, P, count):
+        """Attempt to return the first few odd multiples of a point.
+
+        Parameters
+        ----------
+        P     : Point : Point on the curve.
+        count : int   : Number of odd multiples to compute.
+
+        Returns
+        -------
+        exists : bool      : If each multiple is well-defined.
+        res    : list, int : If well-defined [P, [3]P, ...] else the
+                             obstruction.
+
+        """
+        exists, twoP = self.double(P)
+        res = [P] if exists else twoP
+        while exists and len(res) < count:
+            exists, Q = self.add(res[-1], twoP)
+            if exists:
+                res.append(Q)
+            else:
+                res = Q
+
+        return exists, res
+
+    def multAffine(self, P, k, w=4):
         """Attempt to return k[P].
 
         Parameters
         ----------
         P : Point : Point on the curve.
-        k : int   : Multiple of P.  
+        k : int   : Multiple of P.
+        w : int   : Window width used to recode k (see '_naf').
 
         Returns
         -------
         exists : bool       : If [k]P is well-defined.
         res    : Point, int : If well-defined [k]P else the obstruction.
-        
+
+        Notes
+        -----
+        Every step is computed in affine coordinates, see 'mult' for the
+        faster Jacobian version. The multiple is computed left-to-right over
+        the width-w NAF of |k|, so only about 1/(w+1) of the doublings are
+        followed by an addition. The odd multiples [P, [3]P, ...,
+        [2**(w-1) - 1]P] and their inverses are precomputed once; for k < 0
+        the two tables simply trade places.
+
         """
-        if k < 0:
-            P, k = P.inverse, -k
+        if P.ID or k == 0:
+            exists, res = True, identity
 
-        if isCurveInd(P, k=k):
-            exists, res = True, resCurveInd(P, k=k) 
+        elif k in {1, -1}:
+            exists, res = True, P if k == 1 else P.inverse
 
         else:
-            exists, res = True, identity
-            for bit in bin(k)[:1:-1]:
-                if not exists:
-                    break
-                if bit == '1':
-                    exists, res = self.add(P, res)
+            m = self.modulus
+            digits = _naf(abs(k), w)
+            exists, res = self.__oddMultiples(P, 1 << (w-2))
+            if exists:
+                pos = res
+                neg = [Q if Q.ID else Point(Q.x, -Q.y, m) for Q in pos]
+                if k < 0:
+                    pos, neg = neg, pos
+                res = pos[digits[-1] >> 1]
+                for d in reversed(digits[:-1]):
+                    exists, res = self.double(res)
                     if not exists: break
-                
-                exists, P = self.double(P)
-                
+                    if d:
+                        Q = pos[d >> 1] if d > 0 else neg[-d >> 1]
+                        exists, res = self.add(res, Q)
+                        if not exists: break
+
         return exists, res
+
+    def jdouble(self, P):
+        """Return [2]P for a point in Jacobian coordinates.
+
+        Parameters
+        ----------
+        P : JPoint : A point on the curve.
+
+        Returns
+        -------
+        res : JPoint : The point [2]P.
+
+        Notes
+        -----
+        Uses 'dbl-1998-cmo-2' from the Explicit-Formulas Database, no inversion
+        is needed. If P is the point at infinity or [2]P is, then res.Z = 0.
+
+        """
+        m = self.modulus
+        return JPoint(*jacobianDouble(P.X, P.Y, P.Z, self.a, m), m)
+
+    def jadd(self, P, Q):
+        """Return the sum of two points in Jacobian coordinates.
+
+        Parameters
+        ----------
+        P, Q : JPoint : Points on the curve.
+
+        Returns
+        -------
+        res : JPoint : The point P+Q.
+
+        Notes
+        -----
+        Uses 'add-1998-cmo-2' from the Explicit-Formulas Database, no inversion
+        is needed. Over a composite modulus the sum may be the point at
+        infinity mod some, but not all, prime factors; this shows up as a
+        non-trivial gcd of res.Z and the modulus.
+
+        """
+        m = self.modulus
+        return JPoint(*jacobianAdd(P.X, P.Y, P.Z, Q.X, Q.Y, Q.Z, self.a, m), m)
+
+    def toAffine(self, P):
+        """Attempt to return a point in Jacobian coordinates in affine form.
+
+        Parameters
+        ----------
+        P : JPoint : A point on the curve.
+
+        Returns
+        -------
+        exists : bool       : If the affine point is well-defined.
+        res    : Point, int : If well-defined the affine point else the
+                              obstruction (=gcd(P.Z, m)).
+
+        """
+        exists, zInv = modInv(P.Z, self.modulus)
+        if exists:
+            zInv2 = zInv*zInv
+            res = Point(P.X*zInv2, P.Y*zInv2*zInv, self.modulus)
+        elif zInv == self.modulus:
+            exists, res = True, identity
+        else:
+            res = zInv
+
+        return exists, res
+
+    def mult(self, P, k, w=4, checkEvery=64):
+        """Attempt to return k[P].
+
+        Parameters
+        ----------
+        P          : Point : Point on the curve.
+        k          : int   : Multiple of P.
+        w          : int   : Window width used to recode k (see '_naf').
+        checkEvery : int   : Doublings between checks for an obstruction.
+
+        Returns
+        -------
+        exists : bool       : If [k]P is well-defined.
+        res    : Point, int : If well-defined [k]P else the obstruction.
+
+        Notes
+        -----
+        Same recoding as 'multAffine', but every step is done in Jacobian
+        coordinates so only the final conversion back needs an inversion.
+        The negated table is built directly from the coordinates.
+        An obstruction is a factor of the modulus dividing the Z-coordinate;
+        since it stays a factor once it appears, gcd(Z, m) is only checked
+        every few doublings (and once more at the end). The loop works on
+        bare coordinate tuples through 'jacobianDouble' and 'jacobianAdd'.
+
+        """
+        if P.ID or k == 0:
+            exists, res = True, identity
+
+        elif k in {1, -1}:
+            exists, res = True, P if k == 1 else P.inverse
+
+        else:
+            a, m = self.a, self.modulus
+            digits = _naf(abs(k), w)
+
+            J = (P.x, P.y, 1)
+            twoJ = jacobianDouble(*J, a, m)
+            pos = [J]
+            for _ in range((1 << (w-2)) - 1):
+                pos.append(jacobianAdd(*pos[-1], *twoJ, a, m))
+            neg = [(X, -Y % m, Z) for X, Y, Z in pos]
+            if k < 0:
+                pos, neg = neg, pos
+
+            exists = True
+            X, Y, Z = pos[digits[-1] >> 1]
+            for i, d in enumerate(reversed(digits[:-1]), 1):
+                X, Y, Z = jacobianDouble(X, Y, Z, a, m)
+                if d:
+                    T = pos[d >> 1] if d > 0 else neg[-d >> 1]
+                    X, Y, Z = jacobianAdd(X, Y, Z, *T, a, m)
+                if i % checkEvery == 0:
+                    obs = gcd(Z, m)
+                    if obs not in {1, m}:
+                        exists, res = False, obs
+                        break
+
+            if exists:
+                exists, res = self.toAffine(JPoint(X, Y, Z, m))
+
+        return exists, res
+
+def _naf(k, w=4):
+    """Return the width-w non-adjacent form (NAF) of a positive integer.
+
+    Parameters
+    ----------
+    k : int : Positive integer to be recoded.
+    w : int : Window width, at least 2.
+
+    Returns
+    -------
+    digits : list : Digits, least significant first, with k = sum(d * 2**i).
+
+    Notes
+    -----
+    Each non-zero digit is odd with absolute value less than 2**(w-1), and
+    any w consecutive digits contain at most one non-zero digit.
+
+    Example(s)
+    ----------
+    >>> _naf(7, 3)
+    >>> [-1, 0, 0, 1]
+
+    """
+    window, half = 1 << w, 1 << (w-1)
+    digits = []
+    while k:
+        if k & 1:
+            d = k & (window-1)
+            if d >= half:
+                d -= window
+            k -= d
+        else:
+            d = 0
+        digits.append(d)
+        k >>= 1
+
+    return digits
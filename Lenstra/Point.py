@@ -1,8 +1,15 @@
 """Implement 'Point' class, for points on an EC with components in Z/mZ."""
 
+try:
+    from gmpy2 import mpz
+except ImportError:
+    mpz = int
+
 class Point:
     """Implements points (on an EC) of the form: (x, y) for x, y in Z/mZ."""
-                  
+
+    __slots__ = ('ID', 'x', 'y', 'modulus', '_inverse')
+
     def __init__(self, x=0, y=0, modulus=1, ID=False):
         """Initialize a point.
 
@@ -14,19 +21,39 @@ class Point:
 
         Initializes
         -----------
-        self.ID      : bool : If point represents point at infinity. 
-        self.x       : int  : x-coordinate of point.
-        self.y       : int  : y-coordinate of point.
-        self.modulus : int  : The modulus.
+        self.ID       : bool  : If point represents point at infinity. 
+        self.x        : int   : x-coordinate of point.
+        self.y        : int   : y-coordinate of point.
+        self.modulus  : int   : The modulus.
+        self._inverse : Point : Cached additive inverse (see 'inverse').
         
         """
         self.ID = ID
         self.modulus = modulus
+        self._inverse = None
             
         if self.ID:
             self.x, self.y = float('inf'), float('inf')
         else:
-            self.x, self.y = x % modulus, y % modulus
+            self.x, self.y = mpz(x) % modulus, mpz(y) % modulus
+
+    def __eq__(self, other):
+        """Return if two points are equal.
+
+        Notes
+        -----
+        Points are compared by value, all representations of the point at
+        infinity are equal. The hot paths in 'EC' compare coordinates
+        directly instead.
+
+        """
+        if not isinstance(other, Point):
+            return NotImplemented
+        return self.ID == other.ID and self.x == other.x and self.y == other.y
+
+    def __hash__(self):
+        """Return a hash consistent with '__eq__'."""
+        return hash((self.ID, self.x, self.y))
             
     @property
     def inverse(self):
@@ -36,12 +63,48 @@ class Point:
         -------
         P : Point : The point, P, s.t. P + self == ID under the group law.
 
+        Notes
+        -----
+        Points are never mutated, so the inverse is built on first access and
+        cached (on both points) from then on.
+
         """
-        if self.ID:
-            res = Point(ID=True)
-        else:
-            newY = self.modulus-self.y if (self.y != 0) else 0
-            res = Point(self.x, newY, self.modulus)
-        return res
+        if self._inverse is None:
+            if self.ID:
+                res = Point(ID=True)
+            else:
+                newY = self.modulus-self.y if (self.y != 0) else 0
+                res = Point(self.x, newY, self.modulus)
+            res._inverse = self
+            self._inverse = res
+        return self._inverse
         
 identity = Point(ID=True)
+
+class JPoint:
+    """Implements points (on an EC) in Jacobian coordinates: (X : Y : Z)."""
+
+    __slots__ = ('X', 'Y', 'Z', 'modulus')
+
+    def __init__(self, X=1, Y=1, Z=0, modulus=1):
+        """Initialize a point in Jacobian coordinates.
+
+        Parameters
+        ----------
+        X, Y, Z : int : Jacobian coordinates of the point.
+        modulus : int : (X, Y, Z) is in (Z/mZ)^3 for m = modulus.
+
+        Initializes
+        -----------
+        self.X, self.Y, self.Z : int : Coordinates, where (X : Y : Z) is the
+                                       affine point (X/Z**2, Y/Z**3).
+        self.modulus           : int : The modulus.
+
+        Notes
+        -----
+        The point at infinity is represented by any point with Z = 0, the
+        default arguments give (1 : 1 : 0).
+
+        """
+        self.modulus = modulus
+        self.X, self.Y, self.Z = X % modulus, Y % modulus, Z % modulus
@@ -1,6 +1,12 @@
 """Functions in support of EC class and Lenstra's EC factorization."""
 
-from Point import identity
+from math import factorial as _factorial
+
+try:
+    from gmpy2 import mpz, gcd, invert
+except ImportError:
+    from math import gcd
+    mpz, invert = int, None
 
 def extGCD(n, m):
     """Return the GCD and Bezout coefficients of two integers.
@@ -53,8 +59,19 @@ def modInv(n, m):
 
     >>> modInv(3, 8)
     >>> (True, 3)
+
+    Notes
+    -----
+    Uses GMP (through gmpy2) when available, else falls back on 'extGCD'.
     
     """
+    if invert is not None:
+        try:
+            exists, res = True, invert(n, m)
+        except ZeroDivisionError:
+            exists, res = False, gcd(n, m)
+        return exists, res
+
     n %= m
     n, _, gcf = extGCD(n, m)
     if gcf != 1:
@@ -66,12 +83,132 @@ def modInv(n, m):
         
     return exists, res
 
+def batchModInv(nums, m):
+    """Attempt to invert several elements of Z/mZ using a single inversion.
+
+    Parameters
+    ----------
+    nums : list : Numbers to be inverted (principal values).
+    m    : int  : Modulus being considered.
+
+    Returns
+    -------
+    exists : bool      : If every element is invertible.
+    res    : list, int : If invertible the inverses else the obstruction.
+
+    Notes
+    -----
+    Montgomery's trick: invert the product of the elements, then peel off
+    the individual inverses using the partial products, for a total of one
+    inversion and 3(len(nums) - 1) multiplications. If the product is not
+    invertible, the obstruction is a proper factor of m whenever one of the
+    elements has one.
+
+    Example(s)
+    ----------
+    >>> batchModInv([2, 3, 4], 7)
+    >>> (True, [4, 5, 2])
+
+    >>> batchModInv([2, 3, 4], 15)
+    >>> (False, 3)
+
+    """
+    partials, acc = [], 1
+    for n in nums:
+        acc = (acc * n) % m
+        partials.append(acc)
+
+    exists, inv = modInv(acc, m)
+    if exists:
+        res = [0] * len(nums)
+        for i in range(len(nums)-1, 0, -1):
+            res[i] = (inv * partials[i-1]) % m
+            inv = (inv * nums[i]) % m
+        if nums:
+            res[0] = inv
+    else:
+        res = inv
+        for n in nums:
+            obs = gcd(n, m)
+            if 1 < obs < m:
+                res = obs
+                break
+
+    return exists, res
+
 def factorial(n):
     """Return n!."""
-    return 1 if (n in {0, 1}) else n*factorial(n-1)
+    return _factorial(n)
+
+def primesUpTo(n):
+    """Return the primes less than or equal to n.
 
-def isSmooth(a, b, m):
-    """Return if (y**2 = x**3 + ax + b) for a, b in Z/mZ is smooth.
+    Example(s)
+    ----------
+    >>> primesUpTo(10)
+    >>> [2, 3, 5, 7]
+
+    """
+    sieve = bytearray([1]) * (n+1)
+    sieve[:2] = b'\x00\x00'
+    for p in range(2, int(n**0.5) + 1):
+        if sieve[p]:
+            sieve[p*p::p] = bytes(len(range(p*p, n+1, p)))
+
+    return [p for p in range(2, n+1) if sieve[p]]
+
+def ecmStage1Scalar(B1):
+    """Return the product of the largest prime powers not exceeding B1.
+
+    Parameters
+    ----------
+    B1 : int : The stage 1 bound.
+
+    Returns
+    -------
+    k : int : lcm(1, 2, ..., B1).
+
+    Notes
+    -----
+    [k]P is the point at infinity whenever the order of P is B1-powersmooth,
+    which is all stage 1 of ECM relies on. It is the smallest such k, and
+    far shorter than B1! (about 720 vs 3770 bits for B1 = 500).
+
+    Example(s)
+    ----------
+    >>> ecmStage1Scalar(10)
+    >>> 2520
+
+    """
+    k = 1
+    for p in primesUpTo(B1):
+        q = p
+        while q * p <= B1:
+            q *= p
+        k *= q
+
+    return k
+
+def ecmStage2Primes(B1, B2=None):
+    """Return the primes tried in stage 2 of ECM, those in (B1, B2].
+
+    Parameters
+    ----------
+    B1 : int : The stage 1 bound.
+    B2 : int : The stage 2 bound, defaults to 50*B1.
+
+    Example(s)
+    ----------
+    >>> ecmStage2Primes(10, 20)
+    >>> [11, 13, 17, 19]
+
+    """
+    if B2 is None:
+        B2 = 50*B1
+    return [q for q in primesUpTo(B2) if q > B1]
+
+def singularObstruction(a, b, m):
+    """Return the gcd of m and the discriminant of (y**2 = x**3 + ax + b).
 
     Parameters
     ----------
@@ -80,11 +217,18 @@ def isSmooth(a, b, m):
 
     Returns
     -------
-    - : bool : If the defined curve is smooth.
-    
+    res : int : Product of the prime factors of m (with multiplicity) the
+                curve is singular mod; res=1 iff the curve is smooth mod
+                every prime factor of m.
+
+    Notes
+    -----
+    Uses -discriminant/4 = 64a**3 + 432b**2 (up to the factors 2 and 3).
+    A result other than 1 or m is a proper factor of m.
+
     """
-    negDisc = 64 * a**3 + 432 * b**2
-    return (negDisc % m != 0)
+    negDisc = (a*a*a << 6) + 432*b*b
+    return gcd(negDisc, m)
 
 def modularSlope(P, Q):
     """Return the slope of the line connecting 2 distinct points in (Z/mZ)^2.
@@ -103,7 +247,8 @@ def modularSlope(P, Q):
     In (Z/mZ)^2, the slope of a line connecting points P=(a,b) and Q=(x,y) is
     given by (b-y) * (x-a)**(-1). This is analogous to the classic
     interpretation of the slope, with the added nuisance that (x-a) may not
-    be invertible in Z/mZ.
+    be invertible in Z/mZ. The inversion is inlined (see 'modInv'), this is
+    on the hot path of the affine group law.
 
     Example(s)
     ----------
@@ -117,55 +262,87 @@ def modularSlope(P, Q):
     dx = Q.x - P.x
     modulus = P.modulus
     
-    exists, dxInv = modInv(dx, modulus)
-    if exists:
-        res = (dy * dxInv) % modulus
+    if invert is not None:
+        try:
+            exists, res = True, (dy * invert(dx, modulus)) % modulus
+        except ZeroDivisionError:
+            exists, res = False, gcd(dx, modulus)
     else:
-        res = dxInv
+        n, g, prevX, x = dx % modulus, modulus, 0, 1
+        while n != 0:
+            (q, n), g = divmod(g, n), n
+            prevX, x = x, prevX - q * x
+        exists = (g == 1)
+        res = (dy * prevX) % modulus if exists else g
         
     return exists, res
 
-def isCurveInd(P, Q=identity, k=1):
-    """Return if [k]P + Q is curve-independent.
+def jacobianDouble(X, Y, Z, a, m):
+    """Return [2](X : Y : Z) on (y**2 = x**3 + ax + b) over Z/mZ.
 
     Parameters
     ----------
-    P, Q : Point : Unique points in (Z/mZ)^2.
-    k    : int   : Multiple of P. 
+    X, Y, Z : int : Jacobian coordinates of a point on the curve.
+    a       : int : Coefficient of linear term in associated cubic.
+    m       : int : The modulus.
 
     Returns
     -------
-    - : bool : If [k]P and Q can be added without curve specific information.
+    res : tuple : Reduced Jacobian coordinates of the double.
+
+    Notes
+    -----
+    The group law kernels work on bare integers (no objects, attribute
+    lookups or method calls) so the hot loop in 'EC.mult' stays cheap.
+    Reductions are done lazily: an intermediate is only reduced mod m when
+    it would otherwise be squared or fed into several more products.
 
     """
-    return (P.ID or Q.ID or P == Q.inverse) and (k in {-1, 0, 1})
+    YY = Y*Y % m
+    ZZ = Z*Z % m
+    S = 4*X*YY
+    M = (3*X*X + a*ZZ*ZZ) % m
+    resX = (M*M - 2*S) % m
+    resY = (M*(S - resX) - 8*YY*YY) % m
+    resZ = 2*Y*Z % m
+
+    return resX, resY, resZ
 
-def resCurveInd(P, Q=identity, k=1):
-    """Return [k]P + Q given the sum is curve-independent.
+def jacobianAdd(X1, Y1, Z1, X2, Y2, Z2, a, m):
+    """Return (X1 : Y1 : Z1) + (X2 : Y2 : Z2) on the curve over Z/mZ.
 
     Parameters
     ----------
-    P, Q : Point : Unique points in (Z/mZ)^2.
-    k    : int   : Multiple of P. 
+    X1, Y1, Z1 : int : Jacobian coordinates of a point on the curve.
+    X2, Y2, Z2 : int : Jacobian coordinates of a point on the curve.
+    a          : int : Coefficient of linear term in associated cubic.
+    m          : int : The modulus.
 
     Returns
     -------
-    res : Point : Is equal to [k]P + Q.
-
-    Notes
-    -----
-    The logic in this function is based off of backend use cases, namely
-    it is never the case: (k != 1) and (Q.ID == False).
+    res : tuple : Reduced Jacobian coordinates of the sum.
 
     """
-    if Q.ID and k == 1:
-        res = P
-    elif (P == Q.inverse) or (k == 0):
-        res = identity
-    elif k == -1:
-        res = P.inverse
-    if P.ID:
-        res = Q
+    Z1Z1 = Z1*Z1 % m
+    Z2Z2 = Z2*Z2 % m
+    U1 = X1*Z2Z2
+    S1 = Y1*Z2*Z2Z2
+    H = (X2*Z1Z1 - U1) % m
+    r = (Y2*Z1*Z1Z1 - S1) % m
+
+    if Z1 == 0:
+        res = X2, Y2, Z2
+    elif Z2 == 0:
+        res = X1, Y1, Z1
+    elif H == 0:
+        res = jacobianDouble(X1, Y1, Z1, a, m) if r == 0 else (1, 1, 0)
+    else:
+        HH = H*H % m
+        HHH = H*HH
+        V = U1*HH % m
+        resX = (r*r - HHH - 2*V) % m
+        resY = (r*(V - resX) - S1*HHH) % m
+        resZ = Z1*Z2*H % m
+        res = resX, resY, resZ
 
     return res
-
@@ -1,9 +1,15 @@
 """Implementation of Lenstra's elliptic-curve factorization."""
 
-from random import randint
+import os
+from functools import partial
+from itertools import repeat
+from multiprocessing import Pool
+from random import randint, getrandbits, seed
 from Point import Point
 from EllipticCurve import EC
-from helperFuncs import factorial, isSmooth
+from helperFuncs import (factorial, ecmStage1Scalar, ecmStage2Primes,
+                         singularObstruction, batchModInv, gcd,
+                         jacobianDouble, jacobianAdd)
 
 def generateCurvePoint(m, effort=10**5):
     """Attempt to return a random point on an elliptic curve over Z/mZ.
@@ -15,14 +21,23 @@ def generateCurvePoint(m, effort=10**5):
 
     Returns
     -------
-    P     : Point : Random point in (Z/mZ)^2.
-    curve : EC    : Random elliptic curve over Z/mZ such that P is on it.
+    exists : bool       : If a smooth curve was found (rather than a factor).
+    res    : tuple, int : If found (P, curve) else the obstruction, where:
+                          P     : Point : Random point in (Z/mZ)^2.
+                          curve : EC    : Random elliptic curve over Z/mZ
+                                          such that P is on it.
 
     Raises
     ------
     Exception if no elliptic curve is found - none of the generated Weierstrass
     curves were non-singular.
 
+    Notes
+    -----
+    A curve which is singular mod some, but not all, prime factors of m is
+    not discarded: its discriminant has a proper factor of m in common with
+    m, and that is returned as the obstruction.
+
     """
     haveCurve = False
     for _ in range(effort):
@@ -33,26 +48,142 @@ def generateCurvePoint(m, effort=10**5):
         a = randint(0, m-1)
         b = (t**2 - s**3 - a*s) % m
         
-        if isSmooth(a, b, m):
+        obs = singularObstruction(a, b, m)
+        if obs == 1:
+            haveCurve = True
+            exists, res = True, (Point(s, t, m), EC(a, b, m))
+            break
+        elif obs != m:
             haveCurve = True
-            P = Point(s, t, m)
-            curve = EC(a, b, m)
+            exists, res = False, obs
             break
 
     if not haveCurve:
         raise Exception('No EC found, try increasing effort parameter.')
 
-    return P, curve
+    return exists, res
+
+def generateCurvePoints(m, count, effort=10**5):
+    """Attempt to return random points, each on its own random EC over Z/mZ.
+
+    Parameters
+    ----------
+    m      : int : Modulus being considered, defines ring of scalars Z/mZ.
+    count  : int : Number of points and curves.
+    effort : int : Number of attempts to generate each point and smooth curve.
+
+    Returns
+    -------
+    exists : bool       : If the curves were found (rather than a factor).
+    res    : tuple, int : If found (Ps, curves) else the obstruction.
+
+    """
+    pairs = []
+    for _ in range(count):
+        exists, res = generateCurvePoint(m, effort)
+        if not exists:
+            break
+        pairs.append(res)
+
+    return exists, (tuple(zip(*pairs)) if exists else res)
+
+def ecmStage2(curve, Q, primes, D=210):
+    """Attempt to find an obstruction to [q]Q for a prime q from a list.
+
+    Parameters
+    ----------
+    curve  : EC    : Elliptic curve over Z/mZ.
+    Q      : Point : Point on the curve, typically the output of stage 1.
+    primes : list  : Increasing primes q to try, those below D/2 are skipped.
+    D      : int   : Giant step size, twice an odd number.
+
+    Returns
+    -------
+    res : int : The obstruction, gcd(m, prod of x([g*D]Q) - x([j]Q)) over
+                q = g*D +- j (res=1, if none is found).
+
+    Notes
+    -----
+    Standard (baby-step giant-step) stage 2 of ECM. If [q]Q is the point at
+    infinity mod a prime p | m, then [g*D]Q = +-[j]Q mod p, so p divides the
+    difference of their x-coordinates. The baby steps [j]Q, j odd and at
+    most D/2, are normalized with one batched inversion; the giant steps are
+    kept in Jacobian coordinates, x(G) - x_j = (X - x_j*Z**2) / Z**2, and
+    all differences are multiplied together so a single gcd covers every q.
+
+    """
+    a, m = curve.a, curve.modulus
+    primes = [q for q in primes if 2*q > D]
+    if Q.ID or not primes:
+        return 1
+
+    J = (Q.x, Q.y, 1)
+    twoJ = jacobianDouble(*J, a, m)
+    baby = [J]
+    for _ in range(D//4):
+        baby.append(jacobianAdd(*baby[-1], *twoJ, a, m))
+
+    exists, res = batchModInv([Z for _, _, Z in baby], m)
+    if not exists:
+        return res
+    xs = [X * zInv * zInv % m for (X, _, _), zInv in zip(baby, res)]
+
+    DQ = jacobianDouble(*baby[-1], a, m)
+    g, G, acc = 1, DQ, 1
+    for q in primes:
+        while q > g*D + D//2:
+            G = jacobianAdd(*G, *DQ, a, m)
+            g += 1
+        X, _, Z = G
+        acc = acc * (X - xs[abs(q - g*D) >> 1] * Z * Z) % m
 
-def lenstraFactorial(N, bound=500, effortObs=500, effortGen=10**5):
+    return gcd(acc, m)
+
+def lenstraOneCurve(N, num, effortGen=10**5, primes2=()):
+    """Attempt to find a local obstruction using one random curve.
+
+    Parameters
+    ----------
+    N         : int  : Integer whose factor is to be found.
+    num       : int  : [num]P is computed for a random point P on a random EC.
+    effortGen : int  : Number of attempts to generate a point and smooth curve.
+    primes2   : list : Primes q for which [q]([num]P) is tried in stage 2.
+
+    Returns
+    -------
+    exists : bool       : If [num]P (and stage 2) has no obstruction.
+    res    : Point, int : If well-defined [num]P else the obstruction.
+
+    """
+    exists, res = generateCurvePoint(N, effortGen)
+    if exists:
+        P, curve = res
+        exists, res = curve.mult(P, num)
+
+    if exists and primes2:
+        obs = ecmStage2(curve, res, primes2)
+        if 1 < obs < N:
+            exists, res = False, obs
+
+    return exists, res
+
+def lenstraFactorial(N, bound=500, effortObs=500, effortGen=10**5, B2=None,
+                     scalar=ecmStage1Scalar):
     """Attempt to return a factor of N.
 
     Parameters
     ----------
-    N         : int : Integer whose factor is to be found.
-    bound     : int : [bound!]P for some point P on an EC is computed.
-    effortObs : int : Maximum times EC mult is attempted.
-    effortGen : int : Number of attempts to generate a point and smooth curve.
+    N         : int  : Integer whose factor is to be found.
+    bound     : int  : [k]P for some point P on an EC is computed, where
+                       k = scalar(bound).
+    effortObs : int  : Maximum times EC mult is attempted.
+    effortGen : int  : Number of attempts to generate a point and smooth curve.
+    B2        : int  : Stage 2 bound, primes in (bound, B2] are tried after
+                       stage 1 (see 'ecmStage2'), defaults to 50*bound.
+    scalar    : func : Stage 1 multiple as a function of bound; either
+                       'ecmStage1Scalar' (lcm(1..bound), the default) or
+                       'factorial' (bound!, longer but also covers orders
+                       divisible by prime powers above bound).
 
     Returns
     -------
@@ -65,14 +196,62 @@ def lenstraFactorial(N, bound=500, effortObs=500, effortGen=10**5):
     >>> 2810645183 (0.5822016000020085 seconds)
 
     """
-    num = factorial(bound)
+    num = scalar(bound)
+    primes2 = ecmStage2Primes(bound, B2)
     searching = True
 
     #Search for local obstructions to elliptic curve multiplication
     for _ in range(effortObs):
         if not searching:
             break
-        P, curve = generateCurvePoint(N, effortGen)
-        searching, res = curve.mult(P, num)
+        searching, res = lenstraOneCurve(N, num, effortGen, primes2)
+
+    return N if searching else int(res)
+
+def seedWorker(seedBase):
+    """Seed 'random' in a worker process, see 'lenstraFactorialParallel'."""
+    seed(os.getpid() ^ seedBase)
+
+def lenstraFactorialParallel(N, bound=500, effortObs=500, effortGen=10**5,
+                             B2=None, scalar=ecmStage1Scalar, workers=None):
+    """Attempt to return a factor of N, trying curves in several processes.
+
+    Parameters
+    ----------
+    N         : int  : Integer whose factor is to be found.
+    bound     : int  : [k]P for some point P on an EC is computed, where
+                       k = scalar(bound).
+    effortObs : int  : Maximum times EC mult is attempted.
+    effortGen : int  : Number of attempts to generate a point and smooth curve.
+    B2        : int  : Stage 2 bound, defaults to 50*bound.
+    scalar    : func : Stage 1 multiple as a function of bound (see
+                       'lenstraFactorial').
+    workers   : int  : Number of worker processes (default os.cpu_count()).
+
+    Returns
+    -------
+    res : int : A factor of N (res=N, if factor can't be found).
+
+    Notes
+    -----
+    Same search as 'lenstraFactorial', with the curves handed out one at a
+    time to a pool of processes (the work is bignum arithmetic, so threads
+    would serialize on the GIL). The pool is terminated as soon as one curve
+    yields an obstruction. Each worker reseeds 'random' with its pid so no
+    two workers draw the same curves.
+
+    """
+    num = scalar(bound)
+    primes2 = ecmStage2Primes(bound, B2)
+    searching = True
+
+    oneCurve = partial(lenstraOneCurve, N, num, primes2=primes2)
+    seedBase = getrandbits(64)
+    with Pool(workers, initializer=seedWorker, initargs=(seedBase,)) as pool:
+        tasks = pool.imap_unordered(oneCurve, repeat(effortGen, effortObs),
+                                    chunksize=1)
+        for searching, res in tasks:
+            if not searching:
+                break
 
-    return N if searching else res
+    return N if searching else int(res)